@@ -7,11 +7,14 @@
 # Place the tkdnd2.9.2 folder into Python38\tcl
 # Place the TkinterDnD2 folder into Python38\Lib\site-packages
 
+import bisect
+import collections
+import functools
 import math
-import imageio
 import os
-import re
+import queue
 import sys
+import threading
 import numpy as np
 from PIL import Image, ImageTk
 import tkinter as tk
@@ -22,9 +25,32 @@ import TkinterDnD2 as tkDnD
 __version__ = "1.0.0"
 
 SUPPORTED_EXTENSIONS = {".tif", ".tiff", ".gif", ".png", ".jpeg", ".jpg", ".bmp", ".npz", ".itk"}
+# Nuitka builds ship resources alongside the executable.
+RESOURCE_ROOT = os.path.join(sys.prefix, 'resources') if '__compiled__' in globals() else 'resources'
 ICON_FILE = 'ImQuick.ico'
+ICON_FILES = {'open': "OpenFile.png", 'zoomin': "Plus.png", 'zoomout': "Minus.png", 'next': "Right.png",
+              'prev': "Left.png", 'full': "ActualSize.png", 'fit': "FitWindow.png", 'contrast': "Brightness.png",
+              'autocontrast': "BrightnessAuto.png"}
 INTERP_DEFS = {'Nearest': Image.NEAREST, 'Bilinear': Image.BILINEAR,
                'Bicubic': Image.BICUBIC, 'Lanczos': Image.ANTIALIAS}
+# Filters supported by Image.transform. It can't antialias, so is only used when magnifying.
+AFFINE_FILTERS = {Image.NEAREST, Image.BILINEAR, Image.BICUBIC}
+CHANNEL_MODES = {1: 'L', 2: 'LA', 3: 'RGB', 4: 'RGBA'}
+# Maximum values at which data is assumed to have more bits, and the shifts to bring each depth down to 8-bit.
+# Data with a maximum of 1 or less is treated as 0-1 scaled.
+RESCALE_BOUNDS = (np.nextafter(1, 2), 256, 1024, 4096)
+RESCALE_SHIFTS = (-8, 0, 2, 4, 8)
+PLANE_CACHE_SIZE = 8
+PREFETCH_RANGE = 2
+STATS_CACHE_SIZE = 32
+REDRAW_DELAY = 16  # ms
+# Smallest JPEG worth drawing a preview for, below this the full decode is quick enough not to need one.
+PREVIEW_MIN_PIXELS = 8_000_000
+# Largest zoomed image to keep for panning, relative to the canvas area.
+ZOOM_CACHE_FACTOR = 4
+
+# Image statistics of recently inspected file planes, see cached_image_stats.
+stats_cache = collections.OrderedDict()
 
 
 def not_without_file(func):
@@ -47,6 +73,8 @@ class HideyScrollBar(ttk.Scrollbar):
 
 class ImQuick(tk.Toplevel):
     # Main GUI window
+    icons = None
+
     def __init__(self, master, filename=r""):
         super(ImQuick, self).__init__()
         self.master = master
@@ -54,10 +82,13 @@ class ImQuick(tk.Toplevel):
         self.iconbitmap(resource_directory(ICON_FILE))
         self.geometry(f"500x500")
         self.file = None
+        self.current_basename = ""
         self.file_list = []
         self.current_index = 0
         self.image_data = None
         self.scaled_image_data = None
+        # scaled_image_data as a PIL image, which contrast tables are applied to.
+        self.scaled_image = None
         self.displayed_image = None
         self.display = None
         self.zoom_factor = 1
@@ -65,6 +96,17 @@ class ImQuick(tk.Toplevel):
         self.width = 0
         self.height = 0
         self.container = None
+        self.image_item = None
+        # Canvas position of the image and pixels-per-screen-pixel, refreshed whenever the view is redrawn.
+        self.container_bbox = None
+        self.inverse_zoom = 1
+        self.hover_values = None
+        self.hover_job = None
+        # Pending deferred redraws, so bursts of resize/scroll events only render once.
+        self.resize_job = None
+        self.redraw_job = None
+        # (source image, zoom factor, filter, rendered image) for the last zoom level drawn in full.
+        self.zoom_cache = None
         self.info_popup = None
         self.display_popup = None
         self.about_popup = None
@@ -72,11 +114,24 @@ class ImQuick(tk.Toplevel):
         self.reader = None
         self.max_plane = 0
         self.displayed_plane = 0
+        # Recently used z-planes, filled in ahead of the slider by a background thread.
+        self.plane_cache = collections.OrderedDict()
+        self.plane_lock = threading.Lock()
+        self.reader_lock = threading.Lock()
+        # Cleared while the UI thread is waiting on the reader, so the prefetch worker lets it go first.
+        self.foreground_idle = threading.Event()
+        self.foreground_idle.set()
+        self.prefetch_queue = queue.Queue()
+        threading.Thread(target=self.prefetch_planes, daemon=True).start()
 
         self.min_display_value = tk.IntVar(self, value=0)
         self.max_display_value = tk.IntVar(self, value=255)
         self.per_channel_contrast = False
-        self.display_values_array = [0, 255]
+        # Set while changing both display limits at once, to skip rendering the intermediate state.
+        self.hold_contrast = False
+        # Min and max displayed intensity for each channel, index 0 holds the range used for all channels.
+        self.display_mins = np.zeros(1, dtype=int)
+        self.display_maxs = np.full(1, 255)
         self.z_display_value = tk.IntVar(self, value=0)
         self.interp_mode = tk.StringVar(self, value='Nearest')
 
@@ -92,6 +147,9 @@ class ImQuick(tk.Toplevel):
 
         self.image_frame = ttk.Frame(self)
         self.canvas = tk.Canvas(self.image_frame)
+        self.canvas.imagetk = None
+        self.canvas.preview = None
+        self.photo_mode = None
         h = HideyScrollBar(self.image_frame, orient=tk.HORIZONTAL)
         v = HideyScrollBar(self.image_frame, orient=tk.VERTICAL)
         v.configure(command=self.scroll_y)  # bind scrollbars to the canvas
@@ -132,25 +190,19 @@ class ImQuick(tk.Toplevel):
         self.autocontrast_button = ttk.Button(self.statusbar, style='mini.TButton', text="", command=self.auto_contrast)
         self.contrast_button = ttk.Button(self.statusbar, style='mini.TButton', text="c", command=self.adjust_contrast)
 
-        self.open_icon = tk.PhotoImage(file=resource_directory("OpenFile.png"))
-        self.zoomin_icon = tk.PhotoImage(file=resource_directory("Plus.png"))
-        self.zoomout_icon = tk.PhotoImage(file=resource_directory("Minus.png"))
-        self.next_icon = tk.PhotoImage(file=resource_directory("Right.png"))
-        self.prev_icon = tk.PhotoImage(file=resource_directory("Left.png"))
-        self.full_icon = tk.PhotoImage(file=resource_directory("ActualSize.png"))
-        self.fit_icon = tk.PhotoImage(file=resource_directory("FitWindow.png"))
-        self.contrast_icon = tk.PhotoImage(file=resource_directory("Brightness.png"))
-        self.autocontrast_icon = tk.PhotoImage(file=resource_directory("BrightnessAuto.png"))
-
-        self.open_button.config(image=self.open_icon)
-        self.zoomin_button.config(image=self.zoomin_icon)
-        self.zoomout_button.config(image=self.zoomout_icon)
-        self.next_button.config(image=self.next_icon)
-        self.prev_button.config(image=self.prev_icon)
-        self.zoomfull_button.config(image=self.full_icon)
-        self.zoomfit_button.config(image=self.fit_icon)
-        self.contrast_button.config(image=self.contrast_icon)
-        self.autocontrast_button.config(image=self.autocontrast_icon)
+        if ImQuick.icons is None:
+            # Loaded once and shared between windows, rather than decoding every icon for each new window.
+            ImQuick.icons = {name: tk.PhotoImage(file=resource_directory(file)) for name, file in ICON_FILES.items()}
+
+        self.open_button.config(image=self.icons['open'])
+        self.zoomin_button.config(image=self.icons['zoomin'])
+        self.zoomout_button.config(image=self.icons['zoomout'])
+        self.next_button.config(image=self.icons['next'])
+        self.prev_button.config(image=self.icons['prev'])
+        self.zoomfull_button.config(image=self.icons['full'])
+        self.zoomfit_button.config(image=self.icons['fit'])
+        self.contrast_button.config(image=self.icons['contrast'])
+        self.autocontrast_button.config(image=self.icons['autocontrast'])
 
         self.statusseparator = ttk.Separator(self.statusbar, orient='vertical')
 
@@ -210,13 +262,7 @@ class ImQuick(tk.Toplevel):
 
     def on_drop(self, event):
         # Open files dropped onto the window
-        line = event.data
-        to_open = []
-        for obj in re.findall('{.*?}', line):
-            to_open.append(obj[1:-1])
-            line = line.replace(obj, "")
-        to_open += line.split(" ")
-        for file in to_open:
+        for file in parse_drop_data(event.data):
             if os.path.splitext(file)[-1].lower() in SUPPORTED_EXTENSIONS:
                 if self.file:
                     ImQuick(self.master, file)
@@ -266,10 +312,9 @@ class ImQuick(tk.Toplevel):
             self.max_display_value.set(min_d + 1)
             dirty = True
         if self.display_popup and not self.display_popup.working:
-            offset = self.display_popup.offset
-            self.display_values_array[offset] = self.min_display_value.get()
-            self.display_values_array[offset + 1] = self.max_display_value.get()
-        if not dirty:
+            self.display_mins[self.display_popup.offset] = self.min_display_value.get()
+            self.display_maxs[self.display_popup.offset] = self.max_display_value.get()
+        if not dirty and not self.hold_contrast:
             self.update_contrast()
 
     def update_max_display(self,  *args):
@@ -283,10 +328,9 @@ class ImQuick(tk.Toplevel):
             self.min_display_value.set(max_d - 1)
             dirty = True
         if self.display_popup and not self.display_popup.working:
-            offset = self.display_popup.offset
-            self.display_values_array[offset] = self.min_display_value.get()
-            self.display_values_array[offset + 1] = self.max_display_value.get()
-        if not dirty:
+            self.display_mins[self.display_popup.offset] = self.min_display_value.get()
+            self.display_maxs[self.display_popup.offset] = self.max_display_value.get()
+        if not dirty and not self.hold_contrast:
             self.update_contrast()
 
     @not_without_file
@@ -295,9 +339,77 @@ class ImQuick(tk.Toplevel):
             return
         else:
             self.displayed_plane = self.z_display_value.get()
-            self.image_data = self.reader.get_data(self.displayed_plane)
-            self.scaled_image_data = rescale_data(self.image_data)
+            self.image_data, self.scaled_image_data = self.get_plane(self.displayed_plane)
+            self.scaled_image = array_to_image(self.scaled_image_data, image_mode(self.scaled_image_data))
             self.update_contrast()
+            self.prefetch_neighbours()
+
+    def get_plane(self, plane):
+        # Fetch raw and display data for a z-plane, using the cache where possible.
+        if (planes := self.cached_plane(plane)) is not None:
+            return planes
+        reader = self.reader
+        self.foreground_idle.clear()
+        try:
+            with self.reader_lock:
+                # The prefetch worker may have loaded this plane while we waited for the reader.
+                if (planes := self.cached_plane(plane)) is None:
+                    image_data = reader.get_data(plane)
+                    planes = (image_data, rescale_data(image_data))
+                    self.cache_plane(reader, plane, planes)
+        finally:
+            self.foreground_idle.set()
+        return planes
+
+    def cached_plane(self, plane):
+        # Plane data from the cache, or None if it hasn't been loaded.
+        with self.plane_lock:
+            if plane in self.plane_cache:
+                self.plane_cache.move_to_end(plane)
+                return self.plane_cache[plane]
+        return None
+
+    def cache_plane(self, reader, plane, planes):
+        # Store plane data, discarding it if a different file has since been opened.
+        with self.plane_lock:
+            if reader is not self.reader:
+                return
+            self.plane_cache[plane] = planes
+            self.plane_cache.move_to_end(plane)
+            while len(self.plane_cache) > PLANE_CACHE_SIZE:
+                self.plane_cache.popitem(last=False)
+
+    def prefetch_neighbours(self):
+        # Queue planes either side of the current one for background loading.
+        for step in range(1, PREFETCH_RANGE + 1):
+            for plane in (self.displayed_plane + step, self.displayed_plane - step):
+                if 0 <= plane <= self.max_plane:
+                    self.prefetch_queue.put((self.reader, plane))
+
+    def prefetch_planes(self):
+        # Worker thread. Never touches Tk, results are only handed over via the plane cache.
+        while (job := self.prefetch_queue.get()) is not None:
+            reader, plane = job
+            if self.prefetch_stale(reader, plane):
+                continue
+            # Give way to the UI thread if it's waiting on a plane of its own.
+            self.foreground_idle.wait()
+            try:
+                with self.reader_lock:
+                    # Check again, the slider may have moved or the plane been loaded while waiting for the reader.
+                    if self.prefetch_stale(reader, plane):
+                        continue
+                    image_data = reader.get_data(plane)
+                    # Cached before releasing the reader, so a UI thread waiting on this plane finds it.
+                    self.cache_plane(reader, plane, (image_data, rescale_data(image_data)))
+            except Exception:
+                continue
+
+    def prefetch_stale(self, reader, plane):
+        # Whether a queued prefetch is no longer needed, the slider having moved on or the file changed.
+        with self.plane_lock:
+            return (reader is not self.reader or plane in self.plane_cache
+                    or abs(plane - self.displayed_plane) > PREFETCH_RANGE)
 
     def set_z_plane(self, val):
         try:
@@ -318,25 +430,14 @@ class ImQuick(tk.Toplevel):
 
     def update_contrast(self, *args):
         # Apply pixel min/max intensity display
-        temp_data = self.scaled_image_data.copy()
+        # Image.point applies the table in a single pass with no intermediate arrays, unlike NumPy indexing.
+        # Multi-band images take one table per band, concatenated.
         if self.per_channel_contrast:
-            min_max = self.display_values_array[2:].copy()
-            channels_pool = []
-            for i in range(temp_data.shape[-1]):
-                channel_data = temp_data[:, :, i]
-                new_min = min_max.pop(0)
-                new_max = min_max.pop(0)
-                channel_data[channel_data < new_min] = new_min
-                channel_data = ((channel_data - new_min) / (new_max - new_min))
-                channels_pool.append(channel_data)
-            temp_data = np.dstack(channels_pool)
+            lut = contrast_lut(self.display_mins[1:], self.display_maxs[1:])
         else:
-            new_min = self.min_display_value.get()
-            new_max = self.max_display_value.get()
-            temp_data[temp_data < new_min] = new_min
-            temp_data = ((temp_data - new_min) / (new_max - new_min))
-        temp_data[temp_data > 1] = 1
-        self.displayed_image = Image.fromarray((temp_data * 255).astype('uint8'))
+            lut = contrast_lut(self.min_display_value.get(), self.max_display_value.get())
+            lut = np.tile(lut, len(self.scaled_image.getbands()))
+        self.displayed_image = self.scaled_image.point(lut.ravel().tolist())
         self.show_image()
 
     def about(self):
@@ -365,15 +466,24 @@ class ImQuick(tk.Toplevel):
     @not_without_file
     def auto_contrast(self, event=None):
         # Set contrast range to min-max pixel intensity values.
+        self.hold_contrast = True
         self.min_display_value.set(self.scaled_image_data.min())
         self.max_display_value.set(self.scaled_image_data.max())
+        self.hold_contrast = False
         self.update_contrast()
 
     def load_image(self, file):
         # Open an image
+        # imageio is slow to import, deferring it lets the window appear first.
+        import imageio
         self.canvas.delete("all")
+        self.container = None
+        self.container_bbox = None
+        self.image_item = None
         self.focus_set()
         file = os.path.normpath(file)
+        if os.path.splitext(file)[-1].lower() in ('.jpg', '.jpeg'):
+            self.show_preview(file)
         try:
             self.reader = imageio.get_reader(file)
             if os.path.splitext(file)[-1].lower() in ('.tif', '.tiff'):
@@ -383,15 +493,18 @@ class ImQuick(tk.Toplevel):
                     self.reader = imageio.get_reader(file, format='TIFF-PIL')
             self.max_plane = self.reader.get_length() - 1
             if self.max_plane > 0:
-                self.image_data = self.reader.get_data(self.max_plane // 2)
+                self.displayed_plane = self.max_plane // 2
+                self.image_data = self.reader.get_data(self.displayed_plane)
                 self.z_slider.config(to=self.max_plane)
-                self.z_display_value.set(self.max_plane // 2)
+                self.z_display_value.set(self.displayed_plane)
                 self.stack_ctrl.grid(row=2, column=0, columnspan=2, sticky='ew')
             else:
+                self.displayed_plane = 0
                 self.image_data = self.reader.get_data(0)
                 self.stack_ctrl.grid_remove()
                 self.update()
         except:
+            self.clear_preview()
             self.canvas.create_text(self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2,
                                     anchor=tk.CENTER, text="[Unable to open file]")
             self.reader = None
@@ -401,34 +514,65 @@ class ImQuick(tk.Toplevel):
             self.min_display_value.set(0)
         if self.max_display_value.get() != 255:
             self.max_display_value.set(255)
-        if len(self.image_data.shape) < 3:
-            self.display_values_array = [0, 255]
-        else:
-            self.display_values_array = [0, 255] * (self.image_data.shape[-1] + 1)
+        channels = 1 if len(self.image_data.shape) < 3 else self.image_data.shape[-1] + 1
+        self.display_mins = np.zeros(channels, dtype=int)
+        self.display_maxs = np.full(channels, 255)
         self.scaled_image_data = rescale_data(self.image_data)
-        self.displayed_image = Image.fromarray(self.scaled_image_data)
+        with self.plane_lock:
+            self.plane_cache.clear()
+        if self.max_plane > 0:
+            self.cache_plane(self.reader, self.displayed_plane, (self.image_data, self.scaled_image_data))
+            self.prefetch_neighbours()
+        self.scaled_image = array_to_image(self.scaled_image_data, image_mode(self.scaled_image_data))
+        self.displayed_image = self.scaled_image
         self.width, self.height = self.displayed_image.size
         self.file = file
+        self.current_basename = os.path.basename(file)
         if self.info_popup is not None:
             self.info_popup.show_info(self.image_data, file)
         if self.display_popup is not None:
             self.display_popup.switch_image(file, self.image_data.shape)
         self.first_show_image(loading=True)
+        self.clear_preview()
         self.title(f"ImQuick {__version__} - {'...' + file[-100:] if len(file) > 100 else file}")
         if self.info_popup:
             self.info_popup.show_info(self.image_data, file)
 
+    def show_preview(self, file):
+        # Draw a quick low resolution version of large JPEGs while the full image is decoded.
+        # This costs a second, reduced scale decode, so it's only done when the full one will be slow.
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        try:
+            with Image.open(file) as preview:
+                if (preview.width <= width and preview.height <= height
+                        or preview.width * preview.height < PREVIEW_MIN_PIXELS):
+                    return
+                # Uses draft mode, so libjpeg only decodes at the reduced scale.
+                preview.thumbnail((width, height))
+                self.canvas.preview = ImageTk.PhotoImage(preview)
+        except:
+            return
+        # The view may still be panned from the previous image, so centre on what is currently visible.
+        self.canvas.create_image(self.canvas.canvasx(width // 2), self.canvas.canvasy(height // 2), anchor=tk.CENTER,
+                                 image=self.canvas.preview, tags="preview")
+        self.canvas.update_idletasks()
+
+    def clear_preview(self):
+        # Remove the preview and release its PhotoImage.
+        self.canvas.delete("preview")
+        self.canvas.preview = None
+
     @not_without_file
     def scroll_y(self, *args):
         # Scroll the canvas in the y axis
         self.canvas.yview(*args)
-        self.show_image()
+        self.schedule_redraw()
 
     @not_without_file
     def scroll_x(self, *args):
         # Scroll the canvas in the x axis
         self.canvas.xview(*args)
-        self.show_image()
+        self.schedule_redraw()
 
     @not_without_file
     def move_from(self, event):
@@ -439,7 +583,7 @@ class ImQuick(tk.Toplevel):
     def move_to(self, event):
         # Move canvas to target position when dragging
         self.canvas.scan_dragto(event.x, event.y, gain=1)
-        self.show_image()
+        self.show_image(pan=True)
 
     @not_without_file
     def zoom_in(self):
@@ -466,8 +610,8 @@ class ImQuick(tk.Toplevel):
         # Zoom relative to the mouse cursor
         x = self.canvas.canvasx(event.x)
         y = self.canvas.canvasy(event.y)
-        bbox = self.canvas.bbox(self.container)
-        if not bbox[0] < x < bbox[2] or not bbox[1] < y < bbox[3]:
+        bbox = self.container_bbox
+        if not bbox or not bbox[0] < x < bbox[2] or not bbox[1] < y < bbox[3]:
             return
         scale = 1.0
         if event.delta < 0:
@@ -501,11 +645,11 @@ class ImQuick(tk.Toplevel):
         else:
             self.zoomfit_button.state(['!pressed'])
             self.zoom_factor = 1
-            self.container = self.canvas.create_rectangle(init_x, init_y, init_x + self.width, init_y + self.height,
-                                                          width=0)
-            self.canvas.imagetk = ImageTk.PhotoImage(self.displayed_image)
-            self.canvas.create_image(self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2,
-                                     anchor=tk.CENTER, image=self.canvas.imagetk)
+            self.place_container(init_x, init_y)
+            self.container_bbox = self.canvas.bbox(self.container)
+            self.inverse_zoom = 1
+            self.set_photo(self.displayed_image)
+            self.place_image(self.canvas.winfo_width() // 2, self.canvas.winfo_height() // 2, tk.CENTER)
             self.center_canvas()
 
     def center_canvas(self):
@@ -527,21 +671,39 @@ class ImQuick(tk.Toplevel):
         scale = min((self.canvas.winfo_width() - 4) / self.width, (self.canvas.winfo_height() - 4) / self.height)
         self.zoom_factor = scale
 
-        self.container = self.canvas.create_rectangle(init_x, init_y, init_x + self.width, init_y + self.height,
-                                                      width=0)
+        self.place_container(init_x, init_y)
         self.zoom_image(self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2, scale)
         self.zoomfit_button.state(['pressed'])
 
+    def schedule_redraw(self):
+        # Redraw at most once per REDRAW_DELAY, however many scroll events arrive.
+        if self.redraw_job is None:
+            self.redraw_job = self.after(REDRAW_DELAY, self.finish_redraw)
+
+    def finish_redraw(self):
+        self.redraw_job = None
+        self.show_image(pan=True)
+
     def resize_window(self, *args):
+        # Restart the timer on every event, so only the final size of a window drag is rendered.
+        if self.resize_job:
+            self.after_cancel(self.resize_job)
+        self.resize_job = self.after(REDRAW_DELAY, self.finish_resize)
+
+    def finish_resize(self):
+        self.resize_job = None
         if 'pressed' in self.zoomfit_button.state():
             self.fit_to_window()
         self.show_image()
 
-    def show_image(self, event=None):
+    def show_image(self, event=None, pan=False):
         # Update display of the image on the canvas
-        if not self.container or self.canvas.bbox(self.container) is None:
+        # pan is set for redraws that only move the view, which are worth rendering the whole zoomed image for.
+        self.container_bbox = self.canvas.bbox(self.container) if self.container else None
+        if self.container_bbox is None:
             return
-        image_bbox = self.canvas.bbox(self.container)  # get image area
+        self.inverse_zoom = 1 / self.zoom_factor
+        image_bbox = self.container_bbox  # get image area
         # Remove 1 pixel shift at the sides of the image_bbox
         image_bbox = (image_bbox[0] + 1, image_bbox[1] + 1, image_bbox[2] - 1, image_bbox[3] - 1)
         visible_bbox = (self.canvas.canvasx(0),  # get visible area of the canvas
@@ -569,33 +731,87 @@ class ImQuick(tk.Toplevel):
             des_y2 = y2 / self.zoom_factor
             des_x_width = int(x2 - x1)
             des_y_height = int(y2 - y1)
+            resample = INTERP_DEFS[self.interp_mode.get()]
+
+            if self.zoom_factor == 1:
+                # Actual size, no resampling needed.
+                left, top = math.floor(des_x1), math.floor(des_y1)
+                image = self.displayed_image.crop((left, top, left + des_x_width, top + des_y_height))
+            elif (self.zoom_cache_valid(resample) or pan and self.width * self.height * self.zoom_factor ** 2 <=
+                  ZOOM_CACHE_FACTOR * self.canvas.winfo_width() * self.canvas.winfo_height()):
+                # Small enough to render whole at this zoom level, so panning afterwards is just a crop.
+                # Contrast, plane and zoom changes invalidate it, so those only render the visible tile below.
+                left, top = math.floor(x1), math.floor(y1)
+                image = self.zoomed_image(resample).crop((left, top, left + des_x_width, top + des_y_height))
+            elif self.zoom_factor > 1 and resample in AFFINE_FILTERS:
+                # Magnifying: map the visible area straight from the source in a single affine pass.
+                scale = 1 / self.zoom_factor
+                image = self.displayed_image.transform((des_x_width, des_y_height), Image.AFFINE,
+                                                       (scale, 0, des_x1, 0, scale, des_y1), resample=resample)
+            else:
+                real_x_width = des_x2 - des_x1
+                rnd_x_width = math.ceil(des_x2) - math.floor(des_x1)
+                tgt_x_width = (des_x_width / real_x_width) * rnd_x_width
+
+                real_y_height = des_y2 - des_y1
+                rnd_y_height = math.ceil(des_y2) - math.floor(des_y1)
+                tgt_y_height = (des_y_height / real_y_height) * rnd_y_height
+
+                x = des_x_width / rnd_x_width * (des_x1 - math.floor(des_x1))
+                y = des_y_height / rnd_y_height * (des_y1 - math.floor(des_y1))
+
+                # Crop to target area with a whole-pixel border. Scale, then crop further to the desired subpixels
+                image = self.displayed_image.crop((math.floor(des_x1), math.floor(des_y1),
+                                                   math.ceil(des_x2), math.ceil(des_y2)))
+                image = image.resize((int(tgt_x_width), int(tgt_y_height)), resample=resample)
+                image = image.crop((x, y, x + des_x_width, y + des_y_height))
+            self.set_photo(image)
+            self.place_image(max(visible_bbox[0], image_bbox[0]), max(visible_bbox[1], image_bbox[1]), tk.NW)
+
+    def place_container(self, x, y):
+        # Position the unscaled image bounding box, reusing the existing canvas item.
+        coords = (x, y, x + self.width, y + self.height)
+        if self.container is None:
+            self.container = self.canvas.create_rectangle(*coords, width=0)
+        else:
+            self.canvas.coords(self.container, *coords)
 
-            real_x_width = des_x2 - des_x1
-            rnd_x_width = math.ceil(des_x2) - math.floor(des_x1)
-            tgt_x_width = (des_x_width / real_x_width) * rnd_x_width
-
-            real_y_height = des_y2 - des_y1
-            rnd_y_height = math.ceil(des_y2) - math.floor(des_y1)
-            tgt_y_height = (des_y_height / real_y_height) * rnd_y_height
-
-            x = des_x_width / rnd_x_width * (des_x1 - math.floor(des_x1))
-            y = des_y_height / rnd_y_height * (des_y1 - math.floor(des_y1))
-
-            # First crop to target area, with a whole-pixel border. Scale up, then crop further to the desired subpixels
-            image = self.displayed_image.crop((math.floor(des_x1), math.floor(des_y1),
-                                               math.ceil(des_x2), math.ceil(des_y2)))
-            image = image.resize((int(tgt_x_width), int(tgt_y_height)), resample=INTERP_DEFS[self.interp_mode.get()])
-            image = image.crop((x, y, x + des_x_width, y + des_y_height))
+    def place_image(self, x, y, anchor):
+        # Draw the canvas PhotoImage at a position, reusing the existing canvas item.
+        if self.image_item is None:
+            self.image_item = self.canvas.create_image(x, y, anchor=anchor, image=self.canvas.imagetk)
+        else:
+            self.canvas.coords(self.image_item, x, y)
+            self.canvas.itemconfig(self.image_item, anchor=anchor, image=self.canvas.imagetk)
+
+    def set_photo(self, image):
+        # Put an image into the canvas' PhotoImage, reusing the existing Tk image when the size and mode match.
+        photo = self.canvas.imagetk
+        if photo is not None and (photo.width(), photo.height()) == image.size and self.photo_mode == image.mode:
+            photo.paste(image)
+        else:
             self.canvas.imagetk = ImageTk.PhotoImage(image)
+            self.photo_mode = image.mode
 
-            self.canvas.create_image(max(visible_bbox[0], image_bbox[0]), max(visible_bbox[1], image_bbox[1]),
-                                     anchor='nw', image=self.canvas.imagetk)
+    def zoomed_image(self, resample):
+        # The full image scaled to the current zoom level, re-rendered only when the zoom, filter or image changes.
+        if not self.zoom_cache_valid(resample):
+            size = (max(1, round(self.width * self.zoom_factor)), max(1, round(self.height * self.zoom_factor)))
+            image = self.displayed_image.resize(size, resample=resample)
+            self.zoom_cache = (self.displayed_image, self.zoom_factor, resample, image)
+        return self.zoom_cache[3]
+
+    def zoom_cache_valid(self, resample):
+        # Whether the cached zoomed image matches what is currently displayed.
+        return (self.zoom_cache is not None and self.zoom_cache[0] is self.displayed_image
+                and self.zoom_cache[1:3] == (self.zoom_factor, resample))
 
     def make_file_list(self):
         # Scan the current directory for supported image files.
         directory = os.path.dirname(os.path.abspath(self.file))
-        self.file_list = [os.path.normpath(os.path.join(directory, file)) for file in os.listdir(directory) if
-                          os.path.splitext(file)[-1].lower() in SUPPORTED_EXTENSIONS]
+        with os.scandir(directory) as entries:
+            self.file_list = [entry.path for entry in entries
+                              if os.path.splitext(entry.name)[-1].lower() in SUPPORTED_EXTENSIONS and entry.is_file()]
         self.current_index = self.file_list.index(self.file)
 
     def open_file(self):
@@ -639,22 +855,32 @@ class ImQuick(tk.Toplevel):
 
     def hover_pixel(self, event):
         # Display pixel coordinate and value under the mouse pointer.
-        if self.file and self.displayed_image and (box := self.canvas.bbox(self.container)):
-            event.x = int((self.canvas.canvasx(event.x) - box[0]) / self.zoom_factor)
-            event.y = int((self.canvas.canvasy(event.y) - box[1]) / self.zoom_factor)
-            if 0 <= event.y < self.image_data.shape[0] and 0 <= event.x < self.image_data.shape[1]:
-                pixel = self.image_data[event.y][event.x]  # Correct for border around label.
-                self.xyvalue.set(f"X: {event.x} Y: {event.y}")
-                self.pixelvalue.set(pixel)
+        if self.file and self.displayed_image and (box := self.container_bbox):
+            x = int((self.canvas.canvasx(event.x) - box[0]) * self.inverse_zoom)
+            y = int((self.canvas.canvasy(event.y) - box[1]) * self.inverse_zoom)
+            if 0 <= y < self.image_data.shape[0] and 0 <= x < self.image_data.shape[1]:
+                pixel = self.image_data.item(y, x) if self.image_data.ndim == 2 else self.image_data[y, x]
+                self.set_hover(f"X: {x} Y: {y}", pixel)
                 return "break"
-        self.xyvalue.set("-")
-        self.pixelvalue.set("-")
+        self.set_hover("-", "-")
         return "break"
 
     def no_pixel(self, event):
         # Clear pixel display when not hovering over the image.
-        self.xyvalue.set("-")
-        self.pixelvalue.set("-")
+        self.set_hover("-", "-")
+
+    def set_hover(self, xy, pixel):
+        # Queue a status bar update. Bursts of motion events only update the display once, when Tk is next idle.
+        if self.hover_job is None:
+            self.hover_job = self.after_idle(self.flush_hover)
+        self.hover_values = (xy, pixel)
+
+    def flush_hover(self):
+        # Write the latest queued values to the status bar
+        xy, pixel = self.hover_values
+        self.hover_job = None
+        self.xyvalue.set(xy)
+        self.pixelvalue.set(pixel)
 
     def close(self, event=None):
         # Close the window
@@ -665,14 +891,32 @@ class ImQuick(tk.Toplevel):
             self.display_popup.destroy()
         if self.about_popup:
             self.about_popup.destroy()
+        self.prefetch_queue.put(None)
+        for job in (self.hover_job, self.resize_job, self.redraw_job):
+            if job:
+                self.after_cancel(job)
         self.destroy()
         if not self.master.children:
             # Shut down ImQuick if no other windows are open.
             self.master.destroy()
 
 
-class InfoPopup(tk.Toplevel):
+class Popup(tk.Toplevel):
+    # Base for dialogs owned by an ImQuick window, stored on it under popup_attr.
+    popup_attr = None
+
+    def destroy(self):
+        super(Popup, self).destroy()
+        setattr(self.master, self.popup_attr, None)
+        # Popups are created under the root but have their master swapped to the ImQuick window afterwards,
+        # so Tk's own cleanup misses the root's record. Deregister from the main window manager too.
+        self.master.master.children.pop(self._name, None)
+
+
+class InfoPopup(Popup):
     # Dialog showing image statistics
+    popup_attr = 'info_popup'
+
     def __init__(self, master, data, file):
         super(InfoPopup, self).__init__()
         self.master = master
@@ -690,32 +934,24 @@ class InfoPopup(tk.Toplevel):
         self.geometry(f"250x150+{min(master.winfo_x() + master.winfo_width(),  self.winfo_screenwidth() - 260)}+"
                       f"{master.winfo_y() + 250}")
 
-    def destroy(self):
-        super(InfoPopup, self).destroy()
-        self.master.info_popup = None
-        # Deregister from the main window manager too.
-        if self._name in self.master.master.children:
-            del self.master.master.children[self._name]
-
     def show_info(self, data, file):
-        filename = os.path.split(file)[-1]
-        self.filename.config(text=filename)
-        infotxt = f"""
-        Format: {data.dtype}
-        Width: {data.shape[1]}px
-        Height: {data.shape[0]}px
-        Minimum: {data.min()}
-        Maximum: {data.max()}
-        Unique Values: {len(np.unique(data))}
-        """
+        self.filename.config(text=self.master.current_basename)
+        minimum, maximum, unique = cached_image_stats(data, file, self.master.displayed_plane)
+        infotxt = (f"Format: {data.dtype}\n"
+                   f"Width: {data.shape[1]}px\n"
+                   f"Height: {data.shape[0]}px\n"
+                   f"Minimum: {minimum}\n"
+                   f"Maximum: {maximum}\n"
+                   f"Unique Values: {unique}\n")
         self.info.configure(state=tk.NORMAL)
-        self.info.delete(1.0, tk.END)
-        self.info.insert(tk.INSERT, infotxt)
+        self.info.replace(1.0, tk.END, infotxt)
         self.info.configure(state=tk.DISABLED)
 
 
-class DisplayPopup(tk.Toplevel):
+class DisplayPopup(Popup):
     # Dialog for contrast adjustment
+    popup_attr = 'display_popup'
+
     def __init__(self, master, file, shape):
         super(DisplayPopup, self).__init__()
         self.master = master
@@ -726,10 +962,14 @@ class DisplayPopup(tk.Toplevel):
         self.transient(master)
         # Active channel ID
         self.selected = 0
-        # Index for channel min-max array channel position
+        # Index of the active channel in the master's display_mins/display_maxs arrays
         self.offset = 0
         # Whether to hold off on updating channel array while manipulating sliders
         self.working = False
+        # File and shape the dialog was last set up for
+        self.last_switch = None
+        # Combobox option -> channel ID, -1 being all channels
+        self.channel_map = {'All': -1}
         self.channel_select = ttk.Combobox(self, state="readonly", values=['All'])
         self.channel_select.bind("<<ComboboxSelected>>", self.channel_mode_select)
 
@@ -754,39 +994,35 @@ class DisplayPopup(tk.Toplevel):
         self.geometry(f"200x150+{min(master.winfo_x() + master.winfo_width(),  self.winfo_screenwidth() - 210)}+"
                       f"{master.winfo_y() + 50}")
 
-    def destroy(self):
-        super(DisplayPopup, self).destroy()
-        self.master.display_popup = None
-        # Deregister from the main window manager too.
-        if self._name in self.master.master.children:
-            del self.master.master.children[self._name]
-
     def switch_image(self, file, shape):
-        filename = os.path.split(file)[-1]
-        self.filename.config(text=filename)
+        if self.last_switch == (file, tuple(shape)):
+            # Same image reloaded, the channel list and selection are still valid.
+            return
+        self.last_switch = (file, tuple(shape))
+        self.filename.config(text=self.master.current_basename)
         shape = 0 if len(shape) < 3 else shape[-1]
-        self.channel_select.config(values=['All'] + [f'Channel {x}' for x in range(shape)])
+        self.channel_map = {'All': -1, **{f'Channel {x}': x for x in range(shape)}}
+        self.channel_select.config(values=list(self.channel_map))
         self.channel_select.set('All')
         self.selected = 0
         self.offset = 0
         self.master.per_channel_contrast = False
 
     def channel_mode_select(self, event=None):
-        if self.channel_select.get() == 'All':
-            self.master.per_channel_contrast = False
-            self.selected = -1
-        else:
-            self.master.per_channel_contrast = True
-            self.selected = int(self.channel_select.get()[-1])
-        self.offset = (self.selected + 1) * 2
+        self.selected = self.channel_map[self.channel_select.get()]
+        self.master.per_channel_contrast = self.selected != -1
+        self.offset = self.selected + 1
         self.working = True
-        self.master.min_display_value.set(self.master.display_values_array[self.offset])
-        self.master.max_display_value.set(self.master.display_values_array[self.offset + 1])
+        self.master.min_display_value.set(self.master.display_mins[self.offset])
+        self.master.max_display_value.set(self.master.display_maxs[self.offset])
         self.working = False
 
 
-class AboutPopup(tk.Toplevel):
+class AboutPopup(Popup):
     # Dialog for info about ImQuick
+    popup_attr = 'about_popup'
+    logo = None
+
     def __init__(self, master):
         super(AboutPopup, self).__init__()
         self.master = master
@@ -794,9 +1030,10 @@ class AboutPopup(tk.Toplevel):
         self.resizable(0, 0)
         self.transient(master)
         self.iconbitmap(resource_directory(ICON_FILE))
-        self.logo = Image.open(resource_directory(ICON_FILE)).resize((100, 100))
-        self.logoimg = ImageTk.PhotoImage(self.logo)
-        tk.Label(self, image=self.logoimg).pack(pady=(15, 0))
+        if AboutPopup.logo is None:
+            # Loaded once and kept, rather than decoding and resizing the icon each time the dialog opens.
+            AboutPopup.logo = ImageTk.PhotoImage(Image.open(resource_directory(ICON_FILE)).resize((100, 100)))
+        tk.Label(self, image=self.logo).pack(pady=(15, 0))
         tk.Label(self, text="ImQuick", font=("Arial", 18), justify=tk.CENTER).pack()
         tk.Label(self, text="Version " + __version__, font=("Consolas", 10), justify=tk.CENTER).pack(pady=(0, 5))
         tk.Label(self, text="David Stirling, 2021", font=("Arial", 10), justify=tk.CENTER).pack()
@@ -805,27 +1042,114 @@ class AboutPopup(tk.Toplevel):
         self.geometry(f"250x250+{master.winfo_x() // 2 + (master.winfo_width() // 2)}+"
                       f"{master.winfo_y() // 2 + (master.winfo_height() // 2)}")
 
-    def destroy(self):
-        super(AboutPopup, self).destroy()
-        self.master.about_popup = None
-        # Deregister from the main window manager too.
-        if self._name in self.master.master.children:
-            del self.master.master.children[self._name]
+
+def parse_drop_data(data):
+    # Split a Tk file drop list in a single pass. Paths containing spaces are wrapped in {braces}.
+    files = []
+    i = 0
+    while i < len(data):
+        if data[i] == ' ':
+            i += 1
+        elif data[i] == '{':
+            end = data.find('}', i)
+            end = len(data) if end < 0 else end
+            files.append(data[i + 1:end])
+            i = end + 1
+        else:
+            end = data.find(' ', i)
+            end = len(data) if end < 0 else end
+            files.append(data[i:end])
+            i = end
+    return files
+
+
+def image_stats(data):
+    # Minimum, maximum and number of unique values, gathered in a single pass over the data.
+    kind, size = data.dtype.kind, data.dtype.itemsize
+    if kind in 'ui' and size <= 2:
+        # Tally every possible value, the occupied slots give all three results without sorting.
+        offset = 0
+        if kind == 'i':
+            # Flipping the sign bit maps signed values onto the non-negative range bincount needs, in order.
+            offset = 1 << (8 * size - 1)
+            data = data.view(data.dtype.str.replace('i', 'u')) ^ offset
+        # Order doesn't matter for a tally, so read in memory order rather than copying transposed/Fortran arrays.
+        present = np.flatnonzero(np.bincount(data.ravel(order='K'), minlength=1 << (8 * size)))
+        return present[0] - offset, present[-1] - offset, len(present)
+    # The sort needed to count unique values also gives the extremes.
+    values = np.unique(data)
+    return values[0], values[-1], len(values)
+
+
+def cached_image_stats(data, file, plane):
+    # image_stats for a file plane, remembered so reopening the info dialog doesn't rescan the image.
+    try:
+        mtime = os.path.getmtime(file)
+    except OSError:
+        return image_stats(data)
+    key = (file, mtime, plane, data.shape, data.dtype.str)
+    if key in stats_cache:
+        stats_cache.move_to_end(key)
+        return stats_cache[key]
+    stats = stats_cache[key] = image_stats(data)
+    while len(stats_cache) > STATS_CACHE_SIZE:
+        stats_cache.popitem(last=False)
+    return stats
 
 
 def rescale_data(data):
+    # Convert image data to 8-bit for display.
     maxval = data.max()
-    if maxval >= 4096:
-        out = data / 265
-    elif maxval >= 1024:
-        out = data / 16
-    elif maxval >= 256:
-        out = data / 4
-    elif maxval <= 1:
-        out = data * 256
+    shift = rescale_shift(maxval)
+    if data.dtype == np.uint8 and shift == 0:
+        # Already display-ready, nothing downstream modifies it in place so no copy is needed.
+        return data
+    if data.dtype in (np.uint8, np.uint16):
+        # Every possible value can be precomputed, so the conversion is a single lookup.
+        return rescale_lut(shift, data.dtype.itemsize)[data]
+    out = np.empty(data.shape, np.uint8)
+    if data.dtype.kind in 'ui' and shift >= 0 and maxval >> shift < 256:
+        # Integer results fit in 8 bits, shift straight into the output without an intermediate copy.
+        np.right_shift(data, shift, out=out, casting='unsafe')
+    elif maxval / 2 ** shift < 256:
+        # As above, but floats can't be bit shifted.
+        np.divide(data, 2 ** shift, out=out, casting='unsafe')
     else:
-        out = data
-    return out.astype('uint8')
+        np.clip(data / 2 ** shift, 0, 255, out=out, casting='unsafe')
+    return out
+
+
+def rescale_shift(maxval):
+    # Bits to shift data down by to reach 8-bit, judged from its apparent bit depth. Negative values scale 0-1 data up.
+    return RESCALE_SHIFTS[bisect.bisect_right(RESCALE_BOUNDS, maxval)]
+
+
+@functools.lru_cache(maxsize=None)
+def rescale_lut(shift, itemsize):
+    # Lookup table converting every unsigned integer of the given byte size to 8-bit.
+    values = np.arange(1 << (8 * itemsize))
+    lut = values >> shift if shift >= 0 else values << -shift
+    return np.clip(lut, 0, 255).astype('uint8')
+
+
+def contrast_lut(new_min, new_max):
+    # Lookup table mapping 8-bit values onto the 0-255 display range between new_min and new_max.
+    # Given sequences of per-channel limits, returns a (channels, 256) stack of tables in one pass.
+    new_min = np.asarray(new_min)[..., np.newaxis]
+    new_max = np.asarray(new_max)[..., np.newaxis]
+    lut = (np.arange(256) - new_min) * 255 // (new_max - new_min)
+    return np.clip(lut, 0, 255).astype('uint8')
+
+
+def image_mode(data):
+    # PIL mode matching a uint8 image array
+    return 'L' if data.ndim == 2 else CHANNEL_MODES[data.shape[-1]]
+
+
+def array_to_image(data, mode):
+    # Wrap a uint8 array as a PIL image. Contiguous 'L' and 'RGBA' data is shared rather than copied.
+    data = np.ascontiguousarray(data)
+    return Image.frombuffer(mode, (data.shape[1], data.shape[0]), data, 'raw', mode, 0, 1)
 
 
 def docs():
@@ -840,11 +1164,9 @@ def _load_tkdnd(master):
     master._tkdnd_loaded = True
 
 
+@functools.lru_cache(maxsize=None)
 def resource_directory(target):
-    if '__compiled__' in globals():
-        return os.path.join(sys.prefix, 'resources', target)
-    else:
-        return os.path.join('resources', target)
+    return os.path.join(RESOURCE_ROOT, target)
 
 
 if __name__ == '__main__':